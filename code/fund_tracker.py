@@ -3,10 +3,20 @@
 # Purpose: Program scrapes 13F SEC filing data about hedge fund holdings from 13f.info and displays portfolios over time in a streamlit dashboard
 # To run code: Navigate to file directory in terminal and execute "streamlit run fund_tracker.py"
 
-from datetime import datetime, timedelta
+from datetime import timedelta
+from pathlib import Path
+from io import BytesIO
+import hashlib
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 import json
 import streamlit as st
 import plotly.express as px
@@ -16,72 +26,163 @@ warnings.filterwarnings('ignore')
 # Controls the maximum number of holdings to display in the graph
 MAX_HOLDINGS = 300
 
+# Controls the number of concurrent requests made to 13f.info
+MAX_WORKERS = 16
+
+# Repeated string columns stored as categoricals
+CATEGORICAL_COLUMNS = ['Ticker', 'CUSIP', 'Option Type', 'Quarter', 'Class', 'Principal']
+
+# Column types of the holdings scraped from each filing
+FILING_SCHEMA = pa.schema([
+    ('Quarter', pa.string()),
+    ('Date Filed', pa.string()),
+    ('Ticker', pa.string()),
+    ('Company Name', pa.string()),
+    ('Class', pa.string()),
+    ('CUSIP', pa.string()),
+    ('Value ($000)', pa.float64()),
+    ('Percentage', pa.float64()),
+    ('Shares', pa.float64()),
+    ('Principal', pa.string()),
+    ('Option Type', pa.string()),
+])
+
+# Directory for scraped data persisted across app restarts
+CACHE_DIR = Path(__file__).resolve().parent / 'cache'
+
+# Controls how long the scraped list of funds is reused before scraping again (in hours)
+FUND_LIST_CACHE_HOURS = 24
+
+# Controls how long a fund's scraped filings are reused before scraping again (in hours)
+FILINGS_CACHE_HOURS = 6
+
+# Loads a cached dataframe from disk if it exists and is recent enough, otherwise returns None
+def read_cache(path, max_age_hours):
+    try:
+        if time.time() - path.stat().st_mtime < max_age_hours * 3600:
+            return pd.read_parquet(path, engine='pyarrow')
+    except (OSError, ValueError):
+        pass  # Missing or unreadable cache files are treated as a cache miss
+    return None
+
+# Saves a dataframe to the disk cache, writing to a temp file first so readers never see a partial file
+def write_cache(df, path, compression='snappy'):
+    tmp_path = None
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=path.parent, suffix='.tmp', delete=False) as tmp_file:
+            tmp_path = tmp_file.name
+        df.to_parquet(tmp_path, engine='pyarrow', compression=compression, index=False)
+        os.replace(tmp_path, path)
+    except (OSError, ValueError):
+        # Caching is best effort, so a failed write just means the next load scrapes again
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+# Shared HTTP session so requests reuse pooled keep-alive connections (across reruns) and retry transient failures
+@st.cache_resource
+def get_session():
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS,
+                                          max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])))
+    return session
+
+# Fetches the raw content of each url concurrently, preserving the input order
+def fetch_pages(urls):
+    session = get_session()
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        return list(executor.map(lambda url: session.get(url).content, urls))
+
 # Scrapes the list of all hedge funds on 13f.info
 @st.cache_data
 def gather_fund_list():
-    firm_list_df = pd.DataFrame(columns=['Name', 'URL'])
+    # Use the copy on disk if the fund list was scraped recently
+    cache_path = CACHE_DIR / 'fund_list.parquet'
+    cached_df = read_cache(cache_path, FUND_LIST_CACHE_HOURS)
+    if cached_df is not None:
+        return cached_df
+
+    rows = []
 
     entries = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i', 'j', 'k', 'l', 'm', 'n', 'o', 'p', 'q', 'r', 's', 't', 'u', 'v', 'w', 'x', 'y', 'z', '0']
-    for key in entries:
-        # Make request
-        url = "https://13f.info/managers/" + key
-
-        page = requests.get(url)
-        soup = BeautifulSoup(page.content, 'html.parser')
-
-        # Extract table of firms
-        table = soup.find('table') 
-
-        # Extract hyperlinks
-        data = []
-        for row in table.find_all('tr'):
-            cells = row.find_all('td')
-            if cells:
-                hyperlink = cells[0].find('a')
-                if hyperlink:
-                    text = hyperlink.get_text()  # The text of the hyperlink
-                    link = hyperlink['href']  # The URL of the hyperlink
-                    link = "https://13f.info" + link
-                    data.append([text, link])
-
-        # Add to dataframe
-        df = pd.DataFrame(data, columns=['Name', 'URL'])
-        firm_list_df = pd.concat([firm_list_df, df])
-
-    # firm_list_df.to_csv("firm_list.csv")
+    # Request all pages concurrently
+    pages = fetch_pages(["https://13f.info/managers/" + key for key in entries])
+
+    for content in pages:
+        # Read the table of firms, keeping each cell as a (text, hyperlink) pair
+        table = pd.read_html(BytesIO(content), extract_links='body')[0]
+        rows.extend(table.iloc[:, 0].tolist())
+
+    # Build the dataframe once instead of concatenating per letter
+    firm_list_df = pd.DataFrame(rows, columns=['Name', 'URL']).dropna(subset=['URL'])
+    firm_list_df['URL'] = "https://13f.info" + firm_list_df['URL']
+    firm_list_df = firm_list_df.reset_index(drop=True)
+
+    write_cache(firm_list_df, cache_path, compression='zstd')
     return firm_list_df
 
+# Maps each fund name to its 13f.info URL (first match wins for duplicate names)
+@st.cache_data
+def fund_urls():
+    firm_list_df = gather_fund_list()
+    return dict(zip(firm_list_df['Name'][::-1], firm_list_df['URL'][::-1]))
+
 # Scrapes the filing info for a given hedge fund
 @st.cache_data
 def scrape_filings(homepage_url  = "https://13f.info/manager/0001697868-valley-forge-capital-management-lp"):
+    # Use the copy on disk if this fund was scraped recently
+    cache_path = CACHE_DIR / (hashlib.sha1(homepage_url.encode()).hexdigest() + '.parquet')
+    cached_df = read_cache(cache_path, FILINGS_CACHE_HOURS)
+    if cached_df is not None:
+        return cached_df
+
     # Scrape the page and extract the table of filings for that firm
-    page = requests.get(homepage_url)
-    index_table = pd.read_html(page.content, converters={"Filing ID": str})[0]
+    page = get_session().get(homepage_url)
+    index_table = pd.read_html(BytesIO(page.content), converters={"Filing ID": str})[0]
 
-    df = pd.DataFrame(columns=['Quarter', 'Date Filed', 'Ticker', 'Company Name', 'Class', 'CUSIP', 'Value ($000)', 'Percentage', 'Shares', 'Principal', 'Option Type'])
-    for filing_id in list(index_table['Filing ID']):
-        url = 'https://13f.info/data/13f/' + str(filing_id)
+    # Index the filings table by ID so each filing's quarter/date is a direct lookup
+    filing_info = index_table.set_index('Filing ID')[['Quarter', 'Date Filed']]
 
-        # Send a GET request to the website
-        page = requests.get(url)
-        soup = BeautifulSoup(page.text, 'html.parser')
+    # Request all filings concurrently
+    filing_ids = list(index_table['Filing ID'])
+    pages = fetch_pages(['https://13f.info/data/13f/' + str(filing_id) for filing_id in filing_ids])
 
+    # Accumulate the holdings of every filing into one list per column
+    columns = {name: [] for name in FILING_SCHEMA.names}
+    for filing_id, content in zip(filing_ids, pages):
         # Get JSON object of data
-        data = json.loads(str(soup))
-
-        # Put into data frame
-        filing_df = pd.DataFrame(data['data'], columns=['Ticker', 'Company Name', 'Class', 'CUSIP', 'Value ($000)', 'Percentage', 'Shares', 'Principal', 'Option Type'])
-
-        filing_df['Quarter'] = index_table[index_table["Filing ID"] == filing_id]['Quarter'].iloc[0]
-        filing_df['Date Filed'] = index_table[index_table["Filing ID"] == filing_id]['Date Filed'].iloc[0]
-
-        df = pd.concat([df, filing_df])
-
-    # df.to_csv("all_holdings_data.csv")
+        data = json.loads(content)
+        rows = data['data']
+
+        columns['Quarter'].extend([str(filing_info.loc[filing_id, 'Quarter'])] * len(rows))
+        columns['Date Filed'].extend([str(filing_info.loc[filing_id, 'Date Filed'])] * len(rows))
+        for i, name in enumerate(FILING_SCHEMA.names[2:]):
+            columns[name].extend(row[i] for row in rows)
+
+    # Build a single arrow table for all filings, dictionary encoding the repeated string columns
+    arrays = []
+    for field in FILING_SCHEMA:
+        array = pa.array(columns[field.name], type=field.type)
+        arrays.append(array.dictionary_encode() if field.name in CATEGORICAL_COLUMNS else array)
+    df = pa.Table.from_arrays(arrays, names=FILING_SCHEMA.names).to_pandas()
+
+    write_cache(df, cache_path)
     return df
 
+# Appends ' (put)' or ' (call)' to the ticker of option holdings
+def adjust_tickers(df):
+    option_type = df['Option Type']
+    suffix = np.select([option_type == 'put', option_type == 'call'], [' (put)', ' (call)'], default='')
+    return df['Ticker'].astype(str) + suffix
+
 @st.cache_data
 def preprocess_filings_df(df):
+    # Store repeated string columns as categoricals to save memory and speed up comparisons
+    # Categories are sorted so sorting by these columns stays alphabetical (scraped categories are in order of appearance)
+    for col in CATEGORICAL_COLUMNS:
+        df[col] = df[col].astype('category')
+        df[col] = df[col].cat.set_categories(sorted(df[col].cat.categories))
+
     # Convert 'Date Filed' to datetime
     df['Date Filed'] = pd.to_datetime(df['Date Filed'])
 
@@ -89,69 +190,58 @@ def preprocess_filings_df(df):
     df['Value ($000)'] = 1000 * df['Value ($000)']
     df = df.rename({'Value ($000)': 'Value'}, axis=1)  # Rename column for clarity
 
-    # Drop rows with NaN in 'Percentage'
-    df = df.dropna(subset=['Percentage'])
+    # Drop rows with NaN in 'Percentage' or 'Ticker'
+    df = df.dropna(subset=['Percentage', 'Ticker'])
     
     # Create new variable for quarter end date (to use instead of filing date since these are uniformly spaced)
-    def get_quarter_end(quarter_str):
-        year, quarter = int(quarter_str.split(' ')[1]), quarter_str.split(' ')[0]
-        quarter_end_dates = {
-            'Q1': datetime(year, 3, 31),
-            'Q2': datetime(year, 6, 30),
-            'Q3': datetime(year, 9, 30),
-            'Q4': datetime(year, 12, 31),
-        }
-        return quarter_end_dates[quarter]
-    
-    df['quarter_end'] = df['Quarter'].apply(get_quarter_end)
-    df['quarter_end'] = pd.to_datetime(df['quarter_end']) # Ensure 'quarter_end' is datetime
+    periods = df['Quarter'].str[3:] + df['Quarter'].str[:2] # 'Q1 2024' -> '2024Q1'
+    df['quarter_end'] = pd.PeriodIndex(periods, freq='Q').to_timestamp(how='end').floor('D')
     
     # Sort chronologically
     df.sort_values(by='quarter_end', ascending=True, inplace=True)
     df.reset_index(drop=True, inplace=True)
 
     # Rename Ticker if it's a put/call option
-    df['ticker_adjusted'] = df['Ticker']
-    df.loc[df['Option Type'] == 'put', 'ticker_adjusted'] += ' (put)'
-    df.loc[df['Option Type'] == 'call', 'ticker_adjusted'] += ' (call)'
+    df['ticker_adjusted'] = adjust_tickers(df)
+
+    # Keep a single row per ticker per quarter
+    df = df.drop_duplicates(subset=['ticker_adjusted', 'quarter_end'])
 
     # Get a list of all unique quarter end dates in the DataFrame
-    all_quarters = sorted(df['quarter_end'].unique())
+    all_quarters = np.sort(df['quarter_end'].unique())
+
+    # Find the range of quarters each ticker was held over
+    holding_period = df.groupby('ticker_adjusted')['quarter_end'].agg(['min', 'max'])
+    start = np.searchsorted(all_quarters, holding_period['min'].values)
+    lengths = np.searchsorted(all_quarters, holding_period['max'].values) + 1 - start
+
+    # Build every (ticker, quarter) pair in each holding period as flat arrays so missing quarters show up as empty rows
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    tickers = np.repeat(holding_period.index.values, lengths)
+    quarters = all_quarters[np.repeat(start, lengths) + offsets]
+    full_index = pd.MultiIndex.from_arrays([tickers, quarters], names=['ticker_adjusted', 'quarter_end'])
+    updated_df = df.set_index(['ticker_adjusted', 'quarter_end']).reindex(full_index)
 
     # Add rows with 0 shares in between the time a firm sells and then repurchases the same holding
-    updated_rows = []
-    for ticker in df['ticker_adjusted'].unique():  
-        # Filter the DataFrame for just that ticker
-        ticker_df = df[df['ticker_adjusted'] == ticker]
-        if len(ticker_df) == 0:
-            continue
-
-        # Get min and max quarter end dates for that ticker
-        min_date, max_date = ticker_df['quarter_end'].min(), ticker_df['quarter_end'].max()
-
-        # Add new row with any missing quarter end dates as 0
-        for quarter in all_quarters:
-            if quarter < min_date or quarter > max_date:
-                continue  # Skip quarters outside the holding period for this ticker
-            if quarter not in ticker_df['quarter_end'].values:
-                # If the quarter is missing, add a new row with Value/Number Shares/Percentage as 0
-                updated_rows.append({'Quarter': df[df['quarter_end'] == quarter]['Quarter'].iloc[0],
-                                      'Date Filed':df[df['quarter_end'] == quarter]['Date Filed'].iloc[0], 
-                                      'Ticker':ticker, 
-                                      'Company Name':ticker_df['Company Name'].iloc[0], 
-                                      'Class': ticker_df['Class'].iloc[0], 
-                                      'CUSIP': ticker_df['CUSIP'].iloc[0], 
-                                      'Value': 0, 
-                                      'Percentage': 0, 
-                                      'Shares': 0, 
-                                      'Principal':ticker_df['Principal'].iloc[0], 
-                                      'Option Type': ticker_df['Option Type'].iloc[0],
-                                    'quarter_end': quarter})
-            else:
-                # Add existing rows
-                updated_rows.append(ticker_df[ticker_df['quarter_end'] == quarter].iloc[0].to_dict())
-
-    updated_df = pd.DataFrame(updated_rows)
+    missing = updated_df['Quarter'].isna().values
+    if missing.any():
+        # Value/Number Shares/Percentage are 0 for missing quarters
+        updated_df.loc[missing, ['Value', 'Percentage', 'Shares']] = 0
+
+        # Holding details come from the first filing of that ticker
+        holding_cols = ['Ticker', 'Company Name', 'Class', 'CUSIP', 'Principal', 'Option Type']
+        first_rows = df.drop_duplicates(subset='ticker_adjusted').set_index('ticker_adjusted')[holding_cols]
+        updated_df.loc[missing, holding_cols] = first_rows.reindex(tickers[missing]).values
+
+        # Quarter label and filing date come from the filing for that quarter
+        quarters = updated_df.index.get_level_values('quarter_end')[missing]
+        first_filings = df.drop_duplicates(subset='quarter_end')
+        quarter_labels = dict(zip(first_filings['quarter_end'], first_filings['Quarter']))
+        filing_dates = dict(zip(first_filings['quarter_end'], first_filings['Date Filed']))
+        updated_df.loc[missing, 'Quarter'] = [quarter_labels[quarter] for quarter in quarters]
+        updated_df.loc[missing, 'Date Filed'] = [filing_dates[quarter] for quarter in quarters]
+
+    updated_df = updated_df.reset_index()
 
     # Sort the DataFrame 
     updated_df = updated_df.sort_values(by=['Ticker', 'quarter_end'])
@@ -159,35 +249,41 @@ def preprocess_filings_df(df):
     return updated_df
 
 def filter_date_range(df, date_range):
+    # Compute the full range of quarters once
+    quarter_end = df['quarter_end']
+    min_date, max_date = quarter_end.min(), quarter_end.max()
+
     # Select the appropriate start and end date based on user unput
-    end_date = df['quarter_end'].max()
+    end_date = max_date
     if date_range == '1Y':
-        start_date = max(df['quarter_end'].min(), df['quarter_end'].max() - timedelta(days=365))
+        start_date = max(min_date, max_date - timedelta(days=365))
     elif date_range == '3Y':
-        start_date = max(df['quarter_end'].min(), df['quarter_end'].max() - timedelta(days=3*365))
+        start_date = max(min_date, max_date - timedelta(days=3*365))
     elif date_range == '5Y':
-        start_date = max(df['quarter_end'].min(), df['quarter_end'].max() - timedelta(days=5*365))
+        start_date = max(min_date, max_date - timedelta(days=5*365))
     elif date_range == 'Max':
-        start_date = df['quarter_end'].min()
+        start_date = min_date
     else:
-        start_date = st.date_input("Start date", value=df['quarter_end'].min())
-        end_date = st.date_input("End date", value=df['quarter_end'].max())
+        # Date inputs return plain dates, so convert them for comparison
+        start_date = pd.Timestamp(st.date_input("Start date", value=min_date))
+        end_date = pd.Timestamp(st.date_input("End date", value=max_date))
 
     # Filter date range based on input
-    df = df[(df['quarter_end'] >= pd.to_datetime(start_date)) & (df['quarter_end'] <= pd.to_datetime(end_date))]
+    df = df[quarter_end.between(start_date, end_date)]
     
     return df
 
-@st.cache_data
-def filter_top_k_holdings(df_filtered, k):
+# Returns the set of tickers with the k largest positions at the end date
+def top_k_tickers(df_filtered, k):
     # Get a list of all the top holdings at the end date
-    df_filtered = df_filtered.sort_values(by='quarter_end', ascending=True)
     end_date = df_filtered['quarter_end'].max()
     df_end_date = df_filtered[df_filtered['quarter_end'] == end_date]
-    df_end_date_sorted = df_end_date.sort_values(by='Percentage', ascending=False)
+    return set(df_end_date.nlargest(k, 'Percentage')['Ticker'].unique())
 
+@st.cache_data
+def filter_top_k_holdings(df_filtered, k):
     # Filter top k holdings
-    top_holdings = df_end_date_sorted['Ticker'].head(k).unique()
+    top_holdings = top_k_tickers(df_filtered, k)
     df_filtered = df_filtered[df_filtered['Ticker'].isin(top_holdings)]
     
     return df_filtered
@@ -201,13 +297,8 @@ def make_graph(df_filtered, y_axis):
         "Value": "Value"
     }
 
-    # Adjust ticker label for put/call options
-    df_filtered['ticker_adjusted'] = df_filtered['Ticker']
-    df_filtered.loc[df_filtered['Option Type'] == 'put', 'ticker_adjusted'] += ' (put)' # For rows where 'Option Type' is 'put', append '_put' to the 'color' value
-    df_filtered.loc[df_filtered['Option Type'] == 'call', 'ticker_adjusted'] += ' (call)' # For rows where 'Option Type' is 'put', append '_put' to the 'color' value
-
     # Adjust title if there are options in the portfolio
-    if df_filtered['ticker_adjusted'].str.contains('(call)').any() or df_filtered['ticker_adjusted'].str.contains('(put)').any():
+    if df_filtered['Option Type'].isin(['put', 'call']).any():
         title=f"{y_axis} over time<br><sub>(Options displayed with dashed lines)</sub>"
     else:
         title=f"{y_axis} over time"
@@ -253,7 +344,7 @@ selected_option = st.selectbox("Select fund", options)
 if selected_option:
 
     # When a name is selected, get the corresponding URL
-    selected_url = firm_list_df.loc[firm_list_df['Name'] == selected_option, 'URL'].iloc[0]
+    selected_url = fund_urls()[selected_option]
 
     # Scrape that firm's holdings
     df = scrape_filings(selected_url)
@@ -266,6 +357,7 @@ if selected_option:
 
     # Filter date range
     df_filtered = filter_date_range(df, date_range)
+    unique_tickers = df_filtered['ticker_adjusted'].unique()
 
     # Get user input: y-axis value
     y_axis = st.selectbox('Select Y-axis value', ('Percentage of portfolio', 'Number of shares', 'Value'))
@@ -281,15 +373,15 @@ if selected_option:
     elif holdings_filter_option == 'Top 10 holdings':
         df_filtered = filter_top_k_holdings(df_filtered, 10)
     # Check if more than MAX_HOLDINGS
-    elif holdings_filter_option == 'All holdings' and len(df_filtered['ticker_adjusted'].unique()) > MAX_HOLDINGS:
+    elif holdings_filter_option == 'All holdings' and len(unique_tickers) > MAX_HOLDINGS:
         # Only display the top MAX_HOLDINGS and let user select additional tickers
-        top_holdings_df = filter_top_k_holdings(df_filtered, MAX_HOLDINGS)
+        top_holdings = top_k_tickers(df_filtered, MAX_HOLDINGS)
+
+        prompt = "Select additional tickers (optional, only displaying the top " + str(MAX_HOLDINGS) + " out of " + str(len(unique_tickers)) + " total holdings)"
+        selected_additional_tickers = st.multiselect(prompt, unique_tickers)
 
-        prompt = "Select additional tickers (optional, only displaying the top " + str(MAX_HOLDINGS) + " out of " + str(len(df_filtered['ticker_adjusted'].unique())) + " total holdings)"
-        selected_additional_tickers = st.multiselect(prompt, df_filtered['ticker_adjusted'].unique())
-        additional_tickers_df = df_filtered[df_filtered['ticker_adjusted'].isin(selected_additional_tickers)]
-        
-        df_filtered = pd.concat([top_holdings_df, additional_tickers_df])
+        # Keep the top holdings plus any selected tickers in a single pass
+        df_filtered = df_filtered[df_filtered['Ticker'].isin(top_holdings) | df_filtered['ticker_adjusted'].isin(set(selected_additional_tickers))]
     
     # Make the graph
     make_graph(df_filtered, y_axis)